@@ -11,7 +11,7 @@ from torch import Tensor
 
 
 @dataclass_json
-@dataclass
+@dataclass(slots=True)
 class Mask:
     size: List[int]
     counts: str
@@ -157,14 +157,14 @@ class ClearPointsInVideoResponse:
 
 
 @dataclass_json
-@dataclass
+@dataclass(slots=True)
 class PropagateDataValue:
     object_id: int
     mask: Mask
 
 
 @dataclass_json
-@dataclass
+@dataclass(slots=True)
 class PropagateDataResponse:
     frame_index: int
     results: List[PropagateDataValue]
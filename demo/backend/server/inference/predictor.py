@@ -7,9 +7,10 @@ import contextlib
 import logging
 import os
 import uuid
+from dataclasses import dataclass, field
 from pathlib import Path
-from threading import Lock
-from typing import Any, Dict, Generator, List
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Dict, Generator, Iterable, List, Optional, Tuple
 
 import numpy as np
 import torch
@@ -40,12 +41,34 @@ from sam2.build_sam import build_sam2_video_predictor
 logger = logging.getLogger(__name__)
 
 
+class LazyLogArg:
+    """
+    A logging argument that is only computed if the log record is emitted, for
+    messages that are expensive to build (e.g. iterating over all live sessions).
+    """
+
+    def __init__(self, fn: Callable[[], str]) -> None:
+        self.fn = fn
+
+    def __str__(self) -> str:
+        return self.fn()
+
+
+@dataclass(slots=True)
+class SessionState:
+    state: Dict[str, Any]
+    # set by `cancel_propagate_in_video` from another request thread
+    cancel_event: Event = field(default_factory=Event)
+    # serializes the requests on this session (see `InferenceAPI.inference_lock`)
+    lock: Lock = field(default_factory=Lock)
+
+
 class InferenceAPI:
 
     def __init__(self) -> None:
         super(InferenceAPI, self).__init__()
 
-        self.session_states: Dict[str, Any] = {}
+        self.session_states: Dict[str, SessionState] = {}
         self.score_thresh = 0
 
         if MODEL_SIZE == "tiny":
@@ -71,13 +94,16 @@ class InferenceAPI:
             device = torch.device("mps")
         else:
             device = torch.device("cpu")
-        logger.info(f"using device: {device}")
+        logger.info("using device: %s", device)
 
         if device.type == "cuda":
             # turn on tfloat32 for Ampere GPUs (https://pytorch.org/docs/stable/notes/cuda.html#tensorfloat-32-tf32-on-ampere-devices)
             if torch.cuda.get_device_properties(0).major >= 8:
                 torch.backends.cuda.matmul.allow_tf32 = True
                 torch.backends.cudnn.allow_tf32 = True
+            # the input resolution of the image encoder is fixed, so let cuDNN pick
+            # the fastest convolution algorithms once and reuse them
+            torch.backends.cudnn.benchmark = True
         elif device.type == "mps":
             logging.warning(
                 "\nSupport for MPS devices is preliminary. SAM 2 is trained with CUDA and might "
@@ -86,16 +112,62 @@ class InferenceAPI:
             )
 
         self.device = device
+        # resolved once here since `autocast_context` is entered on every request
+        self.autocast_dtype = self.__select_autocast_dtype(device)
+        logger.info("using autocast dtype: %s", self.autocast_dtype)
+        # optionally compile the model components with `torch.compile` (only on CUDA);
+        # the first requests after startup will be very slow while compiling
+        vos_optimized = os.environ.get("SAM2_DEMO_VOS_OPTIMIZED", "0") == "1"
+        if vos_optimized and device.type != "cuda":
+            logger.warning("ignoring SAM2_DEMO_VOS_OPTIMIZED on device %s", device)
+            vos_optimized = False
         self.predictor = build_sam2_video_predictor(
-            model_cfg, checkpoint, device=device
+            model_cfg, checkpoint, device=device, vos_optimized=vos_optimized
         )
+        # only guards session creation; requests on an existing session are
+        # serialized by that session's own lock so other sessions can proceed
         self.inference_lock = Lock()
+        # side stream for the device-to-host copies of the output masks, so that
+        # a frame's masks are transferred while the next frame is being tracked
+        self.mask_copy_stream = torch.cuda.Stream() if device.type == "cuda" else None
+        # number of propagations running (in any session), so that the device-wide
+        # peak memory counters are only reset when no other propagation is running
+        self.num_active_propagations = 0
+        self.propagation_count_lock = Lock()
+        if vos_optimized:
+            # compile the image encoder in the background instead of in the first
+            # session (holding `inference_lock` so that no session starts meanwhile)
+            Thread(target=self.__warm_up_image_encoder, daemon=True).start()
+
+    def __warm_up_image_encoder(self) -> None:
+        image_size = self.predictor.image_size
+        with torch.inference_mode(), self.autocast_context(), self.inference_lock:
+            logger.info("warming up the compiled image encoder")
+            self.predictor.forward_image(
+                torch.zeros(1, 3, image_size, image_size, device=self.device)
+            )
+            logger.info("finished warming up the compiled image encoder")
+
+    @staticmethod
+    def __select_autocast_dtype(device: torch.device) -> Optional[torch.dtype]:
+        if device.type == "cuda":
+            # always bfloat16 on CUDA (emulated on pre-Ampere GPUs): SAM 2 stores its
+            # memory features in bfloat16, which float16 autocast cannot mix with
+            return torch.bfloat16
+        if device.type == "cpu":
+            # CPU autocast only pays off with native bfloat16 support (AVX512-BF16
+            # or AMX) and is slower than float32 on older CPUs
+            if (
+                torch.cpu._is_avx512_bf16_supported()
+                or torch.cpu._is_amx_tile_supported()
+            ):
+                return torch.bfloat16
+        return None
 
     def autocast_context(self):
-        if self.device.type == "cuda":
-            return torch.autocast("cuda", dtype=torch.bfloat16)
-        else:
+        if self.autocast_dtype is None:
             return contextlib.nullcontext()
+        return torch.autocast(self.device.type, dtype=self.autocast_dtype)
 
     def start_session(self, request: StartSessionRequest) -> StartSessionResponse:
         with self.autocast_context(), self.inference_lock:
@@ -107,10 +179,7 @@ class InferenceAPI:
                 request.path,
                 offload_video_to_cpu=offload_video_to_cpu,
             )
-            self.session_states[session_id] = {
-                "canceled": False,
-                "state": inference_state,
-            }
+            self.session_states[session_id] = SessionState(state=inference_state)
             return StartSessionResponse(session_id=session_id)
 
     def close_session(self, request: CloseSessionRequest) -> CloseSessionResponse:
@@ -120,16 +189,18 @@ class InferenceAPI:
     def add_points(
         self, request: AddPointsRequest, test: str = ""
     ) -> PropagateDataResponse:
-        with self.autocast_context(), self.inference_lock:
-            session = self.__get_session(request.session_id)
-            inference_state = session["state"]
+        session = self.__get_session(request.session_id)
+        inference_state = session.state
 
-            frame_idx = request.frame_index
-            obj_id = request.object_id
-            points = request.points
-            labels = request.labels
-            clear_old_points = request.clear_old_points
+        frame_idx = request.frame_index
+        obj_id = request.object_id
+        points = request.points
+        labels = request.labels
+        clear_old_points = request.clear_old_points
 
+        # only the model call needs the session lock; the returned masks are new
+        # tensors, so thresholding and RLE encoding can happen after releasing it
+        with self.autocast_context(), session.lock:
             # add new prompts and instantly get the output on the same frame
             frame_idx, object_ids, masks = self.predictor.add_new_points_or_box(
                 inference_state=inference_state,
@@ -141,16 +212,16 @@ class InferenceAPI:
                 normalize_coords=False,
             )
 
-            masks_binary = (masks > self.score_thresh)[:, 0].cpu().numpy()
+        masks_binary = self.__get_binary_masks(masks)
 
-            rle_mask_list = self.__get_rle_mask_list(
-                object_ids=object_ids, masks=masks_binary
-            )
+        rle_mask_list = self.__get_rle_mask_list(
+            object_ids=object_ids, masks=masks_binary
+        )
 
-            return PropagateDataResponse(
-                frame_index=frame_idx,
-                results=rle_mask_list,
-            )
+        return PropagateDataResponse(
+            frame_index=frame_idx,
+            results=rle_mask_list,
+        )
 
     def add_mask(self, request: AddMaskRequest) -> PropagateDataResponse:
         """
@@ -158,39 +229,44 @@ class InferenceAPI:
         - mask is a numpy array of shape [H_im, W_im] (containing 1 for foreground and 0 for background).
         Note: providing an input mask would overwrite any previous input points on this frame.
         """
-        with self.autocast_context(), self.inference_lock:
-            session_id = request.session_id
-            frame_idx = request.frame_index
-            obj_id = request.object_id
-            rle_mask = {
-                "counts": request.mask.counts,
-                "size": request.mask.size,
-            }
-
-            mask = decode_masks(rle_mask)
-
-            logger.info(
-                f"add mask on frame {frame_idx} in session {session_id}: {obj_id=}, {mask.shape=}"
-            )
-            session = self.__get_session(session_id)
-            inference_state = session["state"]
+        session_id = request.session_id
+        frame_idx = request.frame_index
+        obj_id = request.object_id
+        rle_mask = {
+            "counts": request.mask.counts,
+            "size": request.mask.size,
+        }
+
+        mask = decode_masks(rle_mask)
+
+        logger.info(
+            "add mask on frame %s in session %s: obj_id=%s, mask.shape=%s",
+            frame_idx,
+            session_id,
+            obj_id,
+            mask.shape,
+        )
+        session = self.__get_session(session_id)
+        inference_state = session.state
+        # wrap the decoded array without copying it and binarize it on the device
+        mask = torch.from_numpy(mask).to(self.device) > 0
 
-            frame_idx, obj_ids, video_res_masks = self.model.add_new_mask(
+        with self.autocast_context(), session.lock:
+            frame_idx, obj_ids, video_res_masks = self.predictor.add_new_mask(
                 inference_state=inference_state,
                 frame_idx=frame_idx,
                 obj_id=obj_id,
-                mask=torch.tensor(mask > 0),
+                mask=mask,
             )
-            masks_binary = (video_res_masks > self.score_thresh)[:, 0].cpu().numpy()
 
-            rle_mask_list = self.__get_rle_mask_list(
-                object_ids=obj_ids, masks=masks_binary
-            )
+        masks_binary = self.__get_binary_masks(video_res_masks)
 
-            return PropagateDataResponse(
-                frame_index=frame_idx,
-                results=rle_mask_list,
-            )
+        rle_mask_list = self.__get_rle_mask_list(object_ids=obj_ids, masks=masks_binary)
+
+        return PropagateDataResponse(
+            frame_index=frame_idx,
+            results=rle_mask_list,
+        )
 
     def clear_points_in_frame(
         self, request: ClearPointsInFrameRequest
@@ -198,31 +274,34 @@ class InferenceAPI:
         """
         Remove all input points in a specific frame.
         """
-        with self.autocast_context(), self.inference_lock:
-            session_id = request.session_id
-            frame_idx = request.frame_index
-            obj_id = request.object_id
+        session_id = request.session_id
+        frame_idx = request.frame_index
+        obj_id = request.object_id
+
+        logger.info(
+            "clear inputs on frame %s in session %s: obj_id=%s",
+            frame_idx,
+            session_id,
+            obj_id,
+        )
+        session = self.__get_session(session_id)
+        inference_state = session.state
 
-            logger.info(
-                f"clear inputs on frame {frame_idx} in session {session_id}: {obj_id=}"
-            )
-            session = self.__get_session(session_id)
-            inference_state = session["state"]
+        with self.autocast_context(), session.lock:
             frame_idx, obj_ids, video_res_masks = (
                 self.predictor.clear_all_prompts_in_frame(
                     inference_state, frame_idx, obj_id
                 )
             )
-            masks_binary = (video_res_masks > self.score_thresh)[:, 0].cpu().numpy()
 
-            rle_mask_list = self.__get_rle_mask_list(
-                object_ids=obj_ids, masks=masks_binary
-            )
+        masks_binary = self.__get_binary_masks(video_res_masks)
 
-            return PropagateDataResponse(
-                frame_index=frame_idx,
-                results=rle_mask_list,
-            )
+        rle_mask_list = self.__get_rle_mask_list(object_ids=obj_ids, masks=masks_binary)
+
+        return PropagateDataResponse(
+            frame_index=frame_idx,
+            results=rle_mask_list,
+        )
 
     def clear_points_in_video(
         self, request: ClearPointsInVideoRequest
@@ -230,42 +309,45 @@ class InferenceAPI:
         """
         Remove all input points in all frames throughout the video.
         """
-        with self.autocast_context(), self.inference_lock:
-            session_id = request.session_id
-            logger.info(f"clear all inputs across the video in session {session_id}")
-            session = self.__get_session(session_id)
-            inference_state = session["state"]
+        session_id = request.session_id
+        logger.info("clear all inputs across the video in session %s", session_id)
+        session = self.__get_session(session_id)
+        inference_state = session.state
+
+        with self.autocast_context(), session.lock:
             self.predictor.reset_state(inference_state)
-            return ClearPointsInVideoResponse(success=True)
+
+        return ClearPointsInVideoResponse(success=True)
 
     def remove_object(self, request: RemoveObjectRequest) -> RemoveObjectResponse:
         """
         Remove an object id from the tracking state.
         """
-        with self.autocast_context(), self.inference_lock:
-            session_id = request.session_id
-            obj_id = request.object_id
-            logger.info(f"remove object in session {session_id}: {obj_id=}")
-            session = self.__get_session(session_id)
-            inference_state = session["state"]
+        session_id = request.session_id
+        obj_id = request.object_id
+        logger.info("remove object in session %s: obj_id=%s", session_id, obj_id)
+        session = self.__get_session(session_id)
+        inference_state = session.state
+
+        with self.autocast_context(), session.lock:
             new_obj_ids, updated_frames = self.predictor.remove_object(
                 inference_state, obj_id
             )
 
-            results = []
-            for frame_index, video_res_masks in updated_frames:
-                masks = (video_res_masks > self.score_thresh)[:, 0].cpu().numpy()
-                rle_mask_list = self.__get_rle_mask_list(
-                    object_ids=new_obj_ids, masks=masks
-                )
-                results.append(
-                    PropagateDataResponse(
-                        frame_index=frame_index,
-                        results=rle_mask_list,
-                    )
+        results = []
+        for frame_index, video_res_masks in updated_frames:
+            masks = self.__get_binary_masks(video_res_masks)
+            rle_mask_list = self.__get_rle_mask_list(
+                object_ids=new_obj_ids, masks=masks
+            )
+            results.append(
+                PropagateDataResponse(
+                    frame_index=frame_index,
+                    results=rle_mask_list,
                 )
+            )
 
-            return RemoveObjectResponse(results=results)
+        return RemoveObjectResponse(results=results)
 
     def propagate_in_video(
         self, request: PropagateInVideoRequest
@@ -282,113 +364,181 @@ class InferenceAPI:
         # Note that as this method is a generator, we also need to use autocast_context
         # in caller to this method to ensure that it's called under the correct context
         # (we've added `autocast_context` to `gen_track_with_mask_stream` in app.py).
-        with self.autocast_context(), self.inference_lock:
+        # Unlike the other requests, the session lock is held for the whole propagation
+        # (including while the caller consumes each frame), as the predictor keeps
+        # updating the inference state between frames.
+        session = self.__get_session(session_id)
+        with self.autocast_context(), session.lock:
             logger.info(
-                f"propagate in video in session {session_id}: "
-                f"{propagation_direction=}, {start_frame_idx=}, {max_frame_num_to_track=}"
+                "propagate in video in session %s: propagation_direction=%r, "
+                "start_frame_idx=%s, max_frame_num_to_track=%s",
+                session_id,
+                propagation_direction,
+                start_frame_idx,
+                max_frame_num_to_track,
             )
 
+            self.__begin_propagation()
             try:
-                session = self.__get_session(session_id)
-                session["canceled"] = False
+                session.cancel_event.clear()
 
-                inference_state = session["state"]
+                inference_state = session.state
                 if propagation_direction not in ["both", "forward", "backward"]:
                     raise ValueError(
                         f"invalid propagation direction: {propagation_direction}"
                     )
 
-                # First doing the forward propagation
+                # First doing the forward propagation, then the backward propagation
+                # (reverse in time); both go through the same per-frame pipeline
+                reverse_flags = []
                 if propagation_direction in ["both", "forward"]:
-                    for outputs in self.predictor.propagate_in_video(
-                        inference_state=inference_state,
-                        start_frame_idx=start_frame_idx,
-                        max_frame_num_to_track=max_frame_num_to_track,
-                        reverse=False,
-                    ):
-                        if session["canceled"]:
-                            return None
-
-                        frame_idx, obj_ids, video_res_masks = outputs
-                        masks_binary = (
-                            (video_res_masks > self.score_thresh)[:, 0].cpu().numpy()
-                        )
-
-                        rle_mask_list = self.__get_rle_mask_list(
-                            object_ids=obj_ids, masks=masks_binary
-                        )
-
-                        yield PropagateDataResponse(
-                            frame_index=frame_idx,
-                            results=rle_mask_list,
-                        )
-
-                # Then doing the backward propagation (reverse in time)
+                    reverse_flags.append(False)
                 if propagation_direction in ["both", "backward"]:
-                    for outputs in self.predictor.propagate_in_video(
-                        inference_state=inference_state,
-                        start_frame_idx=start_frame_idx,
-                        max_frame_num_to_track=max_frame_num_to_track,
-                        reverse=True,
-                    ):
-                        if session["canceled"]:
-                            return None
-
-                        frame_idx, obj_ids, video_res_masks = outputs
-                        masks_binary = (
-                            (video_res_masks > self.score_thresh)[:, 0].cpu().numpy()
-                        )
-
-                        rle_mask_list = self.__get_rle_mask_list(
-                            object_ids=obj_ids, masks=masks_binary
-                        )
-
-                        yield PropagateDataResponse(
-                            frame_index=frame_idx,
-                            results=rle_mask_list,
-                        )
+                    reverse_flags.append(True)
+                for reverse in reverse_flags:
+                    yield from self.__get_propagate_responses(
+                        session,
+                        self.predictor.propagate_in_video(
+                            inference_state=inference_state,
+                            start_frame_idx=start_frame_idx,
+                            max_frame_num_to_track=max_frame_num_to_track,
+                            reverse=reverse,
+                        ),
+                    )
+                    if session.cancel_event.is_set():
+                        return None
             finally:
                 # Log upon completion (so that e.g. we can see if two propagations happen in parallel).
                 # Using `finally` here to log even when the tracking is aborted with GeneratorExit.
                 logger.info(
-                    f"propagation ended in session {session_id}; {self.__get_session_stats()}"
+                    "propagation ended in session %s; %s",
+                    session_id,
+                    LazyLogArg(lambda: self.__get_session_stats(include_peak=True)),
                 )
+                self.__end_propagation()
+
+    def __begin_propagation(self) -> None:
+        with self.propagation_count_lock:
+            if self.num_active_propagations == 0 and self.device.type == "cuda":
+                # so that the peak memory logged at the end covers this propagation
+                # (and any other propagation starting before it ends)
+                torch.cuda.reset_peak_memory_stats()
+            self.num_active_propagations += 1
+
+    def __end_propagation(self) -> None:
+        with self.propagation_count_lock:
+            self.num_active_propagations -= 1
 
     def cancel_propagate_in_video(
         self, request: CancelPropagateInVideoRequest
     ) -> CancelPorpagateResponse:
         session = self.__get_session(request.session_id)
-        session["canceled"] = True
+        session.cancel_event.set()
         return CancelPorpagateResponse(success=True)
 
+    def __get_propagate_responses(
+        self, session: SessionState, outputs: Iterable[Tuple[int, List[int], Any]]
+    ) -> Generator[PropagateDataResponse, None, None]:
+        """
+        Turn the predictor's propagation outputs into responses. On CUDA they are
+        emitted one frame behind: the masks of frame N are copied to the host while
+        frame N - 1 is encoded. Elsewhere the copy is synchronous, so each frame is
+        emitted right away.
+        """
+        cancel_event = session.cancel_event
+        pending = None
+        for frame_idx, obj_ids, video_res_masks in outputs:
+            if cancel_event.is_set():
+                return None
+
+            transfer = self.__start_masks_transfer(video_res_masks)
+            if self.mask_copy_stream is None:
+                yield self.__get_propagate_response(frame_idx, obj_ids, transfer)
+                continue
+            if pending is not None:
+                yield self.__get_propagate_response(*pending)
+            pending = (frame_idx, obj_ids, transfer)
+
+        if pending is not None:
+            yield self.__get_propagate_response(*pending)
+
+    def __get_propagate_response(
+        self,
+        frame_idx: int,
+        obj_ids: List[int],
+        transfer: Tuple[torch.Tensor, Optional[torch.cuda.Event]],
+    ) -> PropagateDataResponse:
+        masks_binary = self.__finish_masks_transfer(*transfer)
+        rle_mask_list = self.__get_rle_mask_list(object_ids=obj_ids, masks=masks_binary)
+        return PropagateDataResponse(
+            frame_index=frame_idx,
+            results=rle_mask_list,
+        )
+
+    def __get_binary_masks(self, video_res_masks: torch.Tensor) -> np.ndarray:
+        """
+        Threshold the [N, 1, H, W] output masks into a Fortran-ordered [H, W, N]
+        uint8 array, so that `encode_masks` can encode all objects in one call.
+        """
+        return self.__finish_masks_transfer(
+            *self.__start_masks_transfer(video_res_masks)
+        )
+
+    @torch.inference_mode()
+    def __start_masks_transfer(
+        self, video_res_masks: torch.Tensor
+    ) -> Tuple[torch.Tensor, Optional[torch.cuda.Event]]:
+        """
+        Threshold the output masks and start copying them to the host. On CUDA the
+        copy goes into pinned memory on `mask_copy_stream` and the returned event
+        marks its completion; elsewhere the copy is synchronous.
+        """
+        # threshold only the channel we keep and lay it out as [N, W, H] on the
+        # device, which is [H, W, N] in Fortran order once transposed on the host
+        masks_binary = (video_res_masks[:, 0] > self.score_thresh).transpose(-1, -2)
+        masks_binary = masks_binary.contiguous()
+        if self.mask_copy_stream is None:
+            return masks_binary.cpu(), None
+
+        masks_host = torch.empty(
+            masks_binary.shape, dtype=masks_binary.dtype, pin_memory=True
+        )
+        self.mask_copy_stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(self.mask_copy_stream):
+            masks_host.copy_(masks_binary, non_blocking=True)
+            copy_done = torch.cuda.Event()
+            copy_done.record()
+        # keep the device buffer alive until the side stream is done reading it
+        masks_binary.record_stream(self.mask_copy_stream)
+        return masks_host, copy_done
+
+    def __finish_masks_transfer(
+        self, masks_host: torch.Tensor, copy_done: Optional[torch.cuda.Event]
+    ) -> np.ndarray:
+        if copy_done is not None:
+            copy_done.synchronize()
+        return masks_host.numpy().view(np.uint8).transpose(2, 1, 0)
+
     def __get_rle_mask_list(
         self, object_ids: List[int], masks: np.ndarray
     ) -> List[PropagateDataValue]:
         """
         Return a list of data values, i.e. list of object/mask combos.
         """
+        # a single `encode_masks` call over the [H, W, N] array encodes all objects
+        mask_rles = encode_masks(masks)
         return [
-            self.__get_mask_for_object(object_id=object_id, mask=mask)
-            for object_id, mask in zip(object_ids, masks)
+            PropagateDataValue(
+                object_id=object_id,
+                mask=Mask(
+                    size=mask_rle["size"],
+                    counts=mask_rle["counts"].decode("ascii"),
+                ),
+            )
+            for object_id, mask_rle in zip(object_ids, mask_rles)
         ]
 
-    def __get_mask_for_object(
-        self, object_id: int, mask: np.ndarray
-    ) -> PropagateDataValue:
-        """
-        Create a data value for an object/mask combo.
-        """
-        mask_rle = encode_masks(np.array(mask, dtype=np.uint8, order="F"))
-        mask_rle["counts"] = mask_rle["counts"].decode()
-        return PropagateDataValue(
-            object_id=object_id,
-            mask=Mask(
-                size=mask_rle["size"],
-                counts=mask_rle["counts"],
-            ),
-        )
-
-    def __get_session(self, session_id: str):
+    def __get_session(self, session_id: str) -> SessionState:
         session = self.session_states.get(session_id, None)
         if session is None:
             raise RuntimeError(
@@ -396,32 +546,58 @@ class InferenceAPI:
             )
         return session
 
-    def __get_session_stats(self):
+    def __get_session_stats(self, include_peak: bool = False):
         """Get a statistics string for live sessions and their GPU usage."""
         # print both the session ids and their video frame numbers
         live_session_strs = [
-            f"'{session_id}' ({session['state']['num_frames']} frames, "
-            f"{len(session['state']['obj_ids'])} objects)"
-            for session_id, session in self.session_states.items()
+            f"'{session_id}' ({session.state['num_frames']} frames, "
+            f"{len(session.state['obj_ids'])} objects)"
+            for session_id, session in list(self.session_states.items())
         ]
         session_stats_str = (
             "Test String Here - -"
             f"live sessions: [{', '.join(live_session_strs)}], GPU memory: "
+            f"{self.__get_memory_stats(include_peak=include_peak)}"
+        )
+        return session_stats_str
+
+    def __get_memory_stats(self, include_peak: bool = False) -> str:
+        """
+        Get a statistics string for the GPU memory usage. The peak usage is only
+        meaningful at the end of a propagation: the counters are reset when a
+        propagation starts while no other one is running, so the peak covers the
+        whole device since the earliest of the currently running propagations.
+        """
+        if self.device.type != "cuda":
+            # the CUDA allocator counters are all zero on other devices
+            return "n/a"
+        memory_stats_str = (
             f"{torch.cuda.memory_allocated() // 1024**2} MiB used and "
             f"{torch.cuda.memory_reserved() // 1024**2} MiB reserved"
-            f" (max over time: {torch.cuda.max_memory_allocated() // 1024**2} MiB used "
-            f"and {torch.cuda.max_memory_reserved() // 1024**2} MiB reserved)"
         )
-        return session_stats_str
+        if include_peak:
+            max_allocated = torch.cuda.max_memory_allocated() // 1024**2
+            max_reserved = torch.cuda.max_memory_reserved() // 1024**2
+            memory_stats_str += (
+                " (device-wide max since the running propagations started: "
+                f"{max_allocated} MiB used and {max_reserved} MiB reserved)"
+            )
+        return memory_stats_str
 
     def __clear_session_state(self, session_id: str) -> bool:
         session = self.session_states.pop(session_id, None)
         if session is None:
             logger.warning(
-                f"cannot close session {session_id} as it does not exist (it might have expired); "
-                f"{self.__get_session_stats()}"
+                "cannot close session %s as it does not exist "
+                "(it might have expired); %s",
+                session_id,
+                LazyLogArg(self.__get_session_stats),
             )
             return False
         else:
-            logger.info(f"removed session {session_id}; {self.__get_session_stats()}")
+            logger.info(
+                "removed session %s; %s",
+                session_id,
+                LazyLogArg(self.__get_session_stats),
+            )
             return True